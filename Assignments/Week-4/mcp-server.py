@@ -3,15 +3,14 @@ from mcp.server.fastmcp import FastMCP, Image
 from mcp.server.fastmcp.prompts import base
 from mcp.types import TextContent
 from mcp import types
-from PIL import Image as PILImage
 import math
 import sys
-import pyautogui
-import subprocess
 import time
 import asyncio
 import os
 import tempfile
+import shutil
+import io
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
@@ -21,15 +20,60 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 import json
+import inspect
 import smtplib
+import numpy as np
+from functools import lru_cache, wraps
 
 # instantiate an MCP server client
 mcp = FastMCP("Calculator")
 
+# stdout carries the stdio JSON-RPC stream, so diagnostics are written straight to
+# the stderr file descriptor. Set MCP_TRACE_CALLS=1 to log every tool invocation.
+_STDERR_FD = sys.stderr.fileno()
+TRACE_CALLS = os.getenv("MCP_TRACE_CALLS") == "1"
+
+def log_stderr(message: str) -> None:
+    """Write a diagnostic line to stderr in a single unbuffered write."""
+    os.write(_STDERR_FD, message.encode() + b"\n")
+
+def traced(tool):
+    """Log every call of tool to stderr when MCP_TRACE_CALLS=1.
+
+    With tracing off the function is returned untouched, so the tools pay
+    nothing for it. Apply it below the @mcp.* decorator.
+    """
+    if not TRACE_CALLS:
+        return tool
+    line = f"CALLED: {tool.__name__}{inspect.signature(tool)}\n".encode()
+    if inspect.iscoroutinefunction(tool):
+        @wraps(tool)
+        async def async_wrapper(*args, **kwargs):
+            os.write(_STDERR_FD, line)
+            return await tool(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(tool)
+    def wrapper(*args, **kwargs):
+        os.write(_STDERR_FD, line)
+        return tool(*args, **kwargs)
+    return wrapper
+
 # Global flag to track if Preview is already running
 preview_is_running = False
 preview_blank_image_path = None
 
+# Pre-rendered 800x600 white PNG shipped next to this file, used by open_paint
+BLANK_CANVAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blank_canvas.png')
+# Scratch file every canvas tool writes and Preview displays
+CANVAS_PATH = os.path.join(tempfile.gettempdir(), "final_result.png")
+
+# Canvas geometry: rectangles are clamped to stay CANVAS_MARGIN px inside the edges
+CANVAS_SIZE = (800, 600)
+CANVAS_MARGIN = 10
+RECT_X_MAX = CANVAS_SIZE[0] - CANVAS_MARGIN
+RECT_Y_MAX = CANVAS_SIZE[1] - CANVAS_MARGIN
+
 # Gmail OAuth2 configuration
 SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 TOKEN_FILE = 'token.json'
@@ -60,10 +104,191 @@ def get_gmail_service():
     
     return build('gmail', 'v1', credentials=creds)
 
+def text_response(text: str) -> dict:
+    """Wrap a status message in the MCP content payload returned by send_email.
+
+    TextContent is built with model_construct since the fields are always
+    valid here, which skips pydantic validation on every tool return.
+    """
+    return {"content": [TextContent.model_construct(type="text", text=text)]}
+
+async def run_command(*args: str) -> int:
+    """Run a command as an asyncio subprocess and return its exit code.
+
+    The event loop is notified when the child exits, so no worker thread is
+    parked waiting on it.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    return await proc.wait()
+
+@lru_cache(maxsize=None)
+def compiled_applescript(source: str):
+    """Compile an AppleScript once; every later run reuses the compiled script."""
+    from Foundation import NSAppleScript
+    script = NSAppleScript.alloc().initWithSource_(source)
+    script.compileAndReturnError_(None)
+    return script
+
+def run_applescript(source: str) -> None:
+    """Run AppleScript in-process instead of spawning an osascript per command.
+
+    NSAppleScript is only safe on the main thread, which is where the stdio
+    event loop runs, so this is deliberately not pushed to a worker thread.
+    """
+    _, error = compiled_applescript(source).executeAndReturnError_(None)
+    if error is not None:
+        log_stderr(f"AppleScript error: {error}")
+
+def preview_window_visible() -> bool:
+    """Check whether Preview currently has an on-screen document window."""
+    import Quartz
+    windows = Quartz.CGWindowListCopyWindowInfo(
+        Quartz.kCGWindowListOptionOnScreenOnly, Quartz.kCGNullWindowID)
+    return any(
+        window.get(Quartz.kCGWindowOwnerName) == 'Preview'
+        and window.get(Quartz.kCGWindowLayer) == 0
+        for window in windows
+    )
+
+def clamp_rect(x1: int, y1: int, x2: int, y2: int) -> tuple:
+    """Clamp rectangle corners into the drawable area of the canvas."""
+    return (max(CANVAS_MARGIN, min(x1, RECT_X_MAX)), max(CANVAS_MARGIN, min(y1, RECT_Y_MAX)),
+            max(CANVAS_MARGIN, min(x2, RECT_X_MAX)), max(CANVAS_MARGIN, min(y2, RECT_Y_MAX)))
+
+def save_canvas(img) -> None:
+    """Write img to CANVAS_PATH for Preview.
+
+    The file is a throwaway that Preview reads once, so it is deflated at
+    level 1 instead of PIL's default 6: several times faster to encode for a
+    few KB more on disk.
+    """
+    img.save(CANVAS_PATH, format='PNG', compress_level=1)
+
+@lru_cache(maxsize=1)
+def get_font():
+    """Load the 36pt Helvetica used for canvas text, falling back to PIL's default font.
+
+    The font is parsed on first use and shared by every later call.
+    """
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype('/System/Library/Fonts/Helvetica.ttc', 36)
+    except OSError:
+        return ImageFont.load_default()
+
+def render_text(draw, text: str, cx: float, cy: float) -> None:
+    """Draw text in black, centered on (cx, cy) by its measured bounding box."""
+    font = get_font()
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    draw.text((cx - (left + right) / 2, cy - (top + bottom) / 2), text, fill='black', font=font)
+
+async def wait_until(predicate, timeout: float = 2.0, initial: float = 0.02) -> bool:
+    """Poll predicate until it is true, backing off up to 100ms between checks.
+
+    Returns as soon as the condition holds instead of sleeping for a fixed
+    worst-case delay. Returns False if it did not hold within timeout.
+    """
+    deadline = time.monotonic() + timeout
+    interval = initial
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, 0.1)
+    return False
+
+async def await_preview_window(timeout: float = 5.0) -> bool:
+    """Wait until a Preview window is on screen."""
+    return await wait_until(preview_window_visible, timeout)
+
+async def quit_preview() -> None:
+    """Quit Preview and wait until the process has actually exited.
+
+    NSRunningApplication.terminate sends the same polite quit as AppleScript
+    without compiling or dispatching a script. A raw SIGTERM is avoided on
+    purpose: Preview would treat it as a crash and restore the old document
+    window on the next launch. Its windows close before the process exits,
+    so a following 'open -a Preview' could otherwise reach the dying instance.
+    """
+    from AppKit import NSRunningApplication
+    apps = NSRunningApplication.runningApplicationsWithBundleIdentifier_('com.apple.Preview')
+    for app in apps:
+        app.terminate()
+    await wait_until(lambda: all(app.isTerminated() for app in apps))
+
+async def close_preview_windows() -> None:
+    """Close Preview's document windows but keep the app running, so reopening is fast."""
+    run_applescript('tell application "Preview" to close every window')
+    await wait_until(lambda: not preview_window_visible())
+
+async def show_in_preview(image_path: str) -> None:
+    """Display image_path in Preview, closing the window left by a previous tool call."""
+    global preview_is_running
+    if preview_is_running:
+        await close_preview_windows()
+    await run_command('open', '-a', 'Preview', image_path)
+    if not await await_preview_window():
+        log_stderr("Preview window did not appear within timeout")
+    preview_is_running = True
+
+# The drawing tools share the canvas file and the Preview window, so once tool calls
+# run concurrently they must still take turns
+canvas_lock = asyncio.Lock()
+
+def holds_canvas_lock(tool):
+    """Serialize an async drawing tool on canvas_lock."""
+    @wraps(tool)
+    async def wrapper(*args, **kwargs):
+        async with canvas_lock:
+            return await tool(*args, **kwargs)
+    return wrapper
+
+# F(92) is the largest Fibonacci number that fits in an int64
+FIB_INT64_MAX_N = 93
+
+def _fib_int64(n):
+    out = np.empty(n, np.int64)
+    a, b = 0, 1
+    for i in range(n):
+        out[i] = a
+        a, b = b, a + b
+    return out
+
+# exp and sum fused into one pass, so no temporary array of exponentials is
+# allocated; 'reassoc' lets LLVM vectorize the reduction, and nogil lets the
+# worker thread it runs on leave the event loop free
+def _exp_sum_kernel(arr):
+    total = 0.0
+    for x in arr:
+        total += math.exp(x)
+    return total
+
+# Fast-math flags for the reduction kernel. nnan/ninf are left out so NaN and
+# inf stay well defined, and so is 'afn', which would allow approximate exp.
+_FASTMATH = {'reassoc', 'nsz', 'arcp', 'contract'}
+
+@lru_cache(maxsize=None)
+def _numba_kernels() -> tuple:
+    """Return the compiled (fib_int64, exp_sum) kernels, or (None, None) without numba.
+
+    numba is an optional accelerator. Importing it and compiling the kernels
+    adds about half a second, so that happens on first use, not at server start.
+    """
+    try:
+        import numba
+    except ImportError:
+        return None, None
+    fib_int64 = numba.njit(numba.int64[:](numba.int64), cache=True)(_fib_int64)
+    exp_sum = numba.njit(numba.float64(numba.float64[::1]), cache=True, nogil=True,
+                         fastmath=_FASTMATH)(_exp_sum_kernel)
+    return fib_int64, exp_sum
+
 # DEFINE TOOLS
 
 #addition tool
 @mcp.tool()
+@traced
 def add(a: int, b: int) -> int:
     """Add two numbers together.
     
@@ -77,10 +302,10 @@ def add(a: int, b: int) -> int:
     Example:
         add(5, 3) -> 8
     """
-    print("CALLED: add(a: int, b: int) -> int:")
-    return int(a + b)
+    return a + b
 
 @mcp.tool()
+@traced
 def add_list(l: list) -> int:
     """Add all numbers in a list together.
     
@@ -93,11 +318,14 @@ def add_list(l: list) -> int:
     Example:
         add_list([1, 2, 3, 4, 5]) -> 15
     """
-    print("CALLED: add_list(l: list) -> int:")
+    if len(l) > 1024 and type(l[0]) is float:
+        # Pairwise summation in C; small lists stay on sum() to skip the array setup
+        return float(np.asarray(l, dtype=np.float64).sum())
     return sum(l)
 
 # subtraction tool
 @mcp.tool()
+@traced
 def subtract(a: int, b: int) -> int:
     """Subtract second number from first number.
     
@@ -111,11 +339,11 @@ def subtract(a: int, b: int) -> int:
     Example:
         subtract(10, 3) -> 7
     """
-    print("CALLED: subtract(a: int, b: int) -> int:")
-    return int(a - b)
+    return a - b
 
 # multiplication tool
 @mcp.tool()
+@traced
 def multiply(a: int, b: int) -> int:
     """Multiply two numbers together.
     
@@ -129,11 +357,11 @@ def multiply(a: int, b: int) -> int:
     Example:
         multiply(4, 6) -> 24
     """
-    print("CALLED: multiply(a: int, b: int) -> int:")
-    return int(a * b)
+    return a * b
 
 #  division tool
 @mcp.tool() 
+@traced
 def divide(a: int, b: int) -> float:
     """Divide first number by second number.
     
@@ -147,34 +375,63 @@ def divide(a: int, b: int) -> float:
     Example:
         divide(15, 3) -> 5.0
     """
-    print("CALLED: divide(a: int, b: int) -> float:")
-    return float(a / b)
+    return a / b
+
+# Powers bigger than this are recomputed instead of memoized, so the cache can
+# hold at most 1024 results of about 512 bytes each
+POWER_CACHE_MAX_BITS = 4096
+
+def _power(a: int, b: int, mod: int = None) -> int | float:
+    if mod is None and b > 0 and b * abs(a).bit_length() > POWER_CACHE_MAX_BITS:
+        return _compute_power(a, b, mod)
+    return _cached_power(a, b, mod)
+
+def _compute_power(a: int, b: int, mod: int = None) -> int | float:
+    if mod is not None:
+        return pow(a, b, mod)
+    if b >= 0 and a in (0, 1, -1):
+        # Trivial bases: the result follows from the exponent's parity alone
+        if b == 0 or a == 1:
+            return 1
+        return a if a == 0 or b & 1 else 1
+    # int ** int is already windowed square-and-multiply in C (CPython's long_pow)
+    return a ** b
+
+_cached_power = lru_cache(maxsize=1024)(_compute_power)
 
 # power tool
 @mcp.tool()
-def power(a: int, b: int) -> int:
-    """Calculate a raised to the power of b.
+@traced
+def power(a: int, b: int, mod: int = None) -> int | float:
+    """Calculate a raised to the power of b, optionally modulo mod.
+    
+    Pass mod when only the remainder is needed: the result is reduced at
+    every step, so even huge exponents stay fast.
     
     Args:
         a (int): Base number
         b (int): Exponent
+        mod (int, optional): Modulus to reduce the result by
         
     Returns:
-        int: a raised to the power of b
+        int | float: a raised to the power of b (modulo mod if given); a float
+        when b is negative and no mod is given
         
     Example:
         power(2, 3) -> 8
+        power(2, -3) -> 0.125
+        power(2, 100, 1000) -> 376
     """
-    print("CALLED: power(a: int, b: int) -> int:")
-    return int(a ** b)
+    return _power(a, b, mod)
 
 # square root tool
 @mcp.tool()
-def sqrt(a: int) -> float:
+@traced
+def sqrt(a: float) -> float:
     """Calculate the square root of a number.
     
     Args:
-        a (int): Number to find square root of
+        a (float): Number to find square root of
         
     Returns:
         float: The square root of a
@@ -182,29 +439,38 @@ def sqrt(a: int) -> float:
     Example:
         sqrt(16) -> 4.0
     """
-    print("CALLED: sqrt(a: int) -> float:")
-    return float(a ** 0.5)
+    return math.sqrt(a)
 
 # cube root tool
 @mcp.tool()
-def cbrt(a: int) -> float:
+@traced
+def cbrt(a: float) -> float:
     """Calculate the cube root of a number.
     
     Args:
-        a (int): Number to find cube root of
+        a (float): Number to find cube root of
         
     Returns:
         float: The cube root of a
         
     Example:
-        cbrt(27) -> 3.0
+        cbrt(27) -> 3.0 (the last digit depends on the platform's libm;
+        glibc returns 3.0000000000000004)
     """
-    print("CALLED: cbrt(a: int) -> float:")
-    return float(a ** (1/3))
+    return math.cbrt(a)
+
+# 0! .. 170!; 170! is the largest factorial that still fits in a float
+FACTORIAL_TABLE = tuple(math.factorial(i) for i in range(171))
+
+def _factorial_uncached(a: int) -> int:
+    # Everything that reaches here is past the table and at least 1000 bits, so
+    # it is not memoized: a cache would pin those results for the process lifetime
+    return math.factorial(a)
 
 # factorial tool
 @mcp.tool()
-def factorial(a: int) -> int:
+@traced
+async def factorial(a: int) -> int:
     """Calculate the factorial of a number (n!).
     
     Args:
@@ -216,16 +482,40 @@ def factorial(a: int) -> int:
     Example:
         factorial(5) -> 120
     """
-    print("CALLED: factorial(a: int) -> int:")
-    return int(math.factorial(a))
+    if 0 <= a < len(FACTORIAL_TABLE):
+        return FACTORIAL_TABLE[a]
+    return await asyncio.to_thread(_factorial_uncached, a)
+
+# log factorial tool
+@mcp.tool()
+@traced
+def log_factorial(a: int) -> float:
+    """Calculate the natural logarithm of the factorial of a number, ln(n!).
+    
+    Use this instead of log(factorial(n)) when only the magnitude is needed:
+    it never builds the huge integer n! and stays fast for any n.
+    
+    Args:
+        a (int): Non-negative number to take the log factorial of
+        
+    Returns:
+        float: The natural logarithm of a!
+        
+    Example:
+        log_factorial(5) -> 4.787491742782047
+    """
+    if a < 0:
+        raise ValueError("factorial() not defined for negative values")
+    return math.lgamma(a + 1)
 
 # log tool
 @mcp.tool()
-def log(a: int) -> float:
+@traced
+def log(a: float) -> float:
     """Calculate the natural logarithm of a number (ln).
     
     Args:
-        a (int): Number to calculate natural log of
+        a (float): Number to calculate natural log of
         
     Returns:
         float: The natural logarithm of a
@@ -233,11 +523,11 @@ def log(a: int) -> float:
     Example:
         log(2.718281828459045) -> 1.0
     """
-    print("CALLED: log(a: int) -> float:")
-    return float(math.log(a))
+    return math.log(a)
 
 # remainder tool
 @mcp.tool()
+@traced
 def remainder(a: int, b: int) -> int:
     """Calculate the remainder when a is divided by b.
     
@@ -251,16 +541,16 @@ def remainder(a: int, b: int) -> int:
     Example:
         remainder(17, 5) -> 2
     """
-    print("CALLED: remainder(a: int, b: int) -> int:")
-    return int(a % b)
+    return a % b
 
 # sin tool
 @mcp.tool()
-def sin(a: int) -> float:
+@traced
+def sin(a: float) -> float:
     """Calculate the sine of an angle in radians.
     
     Args:
-        a (int): Angle in radians
+        a (float): Angle in radians
         
     Returns:
         float: The sine of the angle
@@ -268,16 +558,16 @@ def sin(a: int) -> float:
     Example:
         sin(0) -> 0.0
     """
-    print("CALLED: sin(a: int) -> float:")
-    return float(math.sin(a))
+    return math.sin(a)
 
 # cos tool
 @mcp.tool()
-def cos(a: int) -> float:
+@traced
+def cos(a: float) -> float:
     """Calculate the cosine of an angle in radians.
     
     Args:
-        a (int): Angle in radians
+        a (float): Angle in radians
         
     Returns:
         float: The cosine of the angle
@@ -285,16 +575,16 @@ def cos(a: int) -> float:
     Example:
         cos(0) -> 1.0
     """
-    print("CALLED: cos(a: int) -> float:")
-    return float(math.cos(a))
+    return math.cos(a)
 
 # tan tool
 @mcp.tool()
-def tan(a: int) -> float:
+@traced
+def tan(a: float) -> float:
     """Calculate the tangent of an angle in radians.
     
     Args:
-        a (int): Angle in radians
+        a (float): Angle in radians
         
     Returns:
         float: The tangent of the angle
@@ -302,11 +592,110 @@ def tan(a: int) -> float:
     Example:
         tan(0) -> 0.0
     """
-    print("CALLED: tan(a: int) -> float:")
-    return float(math.tan(a))
+    return math.tan(a)
+
+
+def _batch_math(ufunc, values: list, positive_only: bool = False, non_negative_only: bool = False) -> list:
+    """Apply a NumPy ufunc to a whole list in one vectorized pass."""
+    arr = np.asarray(values, dtype=np.float64)
+    if (positive_only and (arr <= 0).any()) or (non_negative_only and (arr < 0).any()):
+        raise ValueError("math domain error")
+    return ufunc(arr).tolist()
+
+# batch math tools
+@mcp.tool()
+@traced
+def sin_batch(values: list[float]) -> list:
+    """Calculate the sine of every angle (in radians) in a list with one call.
+    
+    Prefer this over calling sin once per value.
+    
+    Args:
+        values (list[float]): Angles in radians
+        
+    Returns:
+        list: The sine of each angle, in input order
+        
+    Example:
+        sin_batch([0, 1]) -> [0.0, 0.8414709848078965]
+    """
+    return _batch_math(np.sin, values)
+
+@mcp.tool()
+@traced
+def cos_batch(values: list[float]) -> list:
+    """Calculate the cosine of every angle (in radians) in a list with one call.
+    
+    Prefer this over calling cos once per value.
+    
+    Args:
+        values (list[float]): Angles in radians
+        
+    Returns:
+        list: The cosine of each angle, in input order
+        
+    Example:
+        cos_batch([0, 1]) -> [1.0, 0.5403023058681398]
+    """
+    return _batch_math(np.cos, values)
+
+@mcp.tool()
+@traced
+def tan_batch(values: list[float]) -> list:
+    """Calculate the tangent of every angle (in radians) in a list with one call.
+    
+    Prefer this over calling tan once per value.
+    
+    Args:
+        values (list[float]): Angles in radians
+        
+    Returns:
+        list: The tangent of each angle, in input order
+        
+    Example:
+        tan_batch([0, 1]) -> [0.0, 1.5574077246549023]
+    """
+    return _batch_math(np.tan, values)
+
+@mcp.tool()
+@traced
+def log_batch(values: list[float]) -> list:
+    """Calculate the natural logarithm of every number in a list with one call.
+    
+    Prefer this over calling log once per value.
+    
+    Args:
+        values (list[float]): Positive numbers
+        
+    Returns:
+        list: The natural logarithm of each number, in input order
+        
+    Example:
+        log_batch([1, 10]) -> [0.0, 2.302585092994046]
+    """
+    return _batch_math(np.log, values, positive_only=True)
+
+@mcp.tool()
+@traced
+def sqrt_batch(values: list[float]) -> list:
+    """Calculate the square root of every number in a list with one call.
+    
+    Prefer this over calling sqrt once per value.
+    
+    Args:
+        values (list[float]): Non-negative numbers
+        
+    Returns:
+        list: The square root of each number, in input order
+        
+    Example:
+        sqrt_batch([4, 9, 16]) -> [2.0, 3.0, 4.0]
+    """
+    return _batch_math(np.sqrt, values, non_negative_only=True)
 
 # mine tool
 @mcp.tool()
+@traced
 def mine(a: int, b: int) -> int:
     """Subtract twice the second number from the first number.
     
@@ -320,10 +709,10 @@ def mine(a: int, b: int) -> int:
     Example:
         mine(10, 2) -> 6
     """
-    print("CALLED: mine(a: int, b: int) -> int:")
-    return int(a - b - b)
+    return a - b - b
 
 @mcp.tool()
+@traced
 def create_thumbnail(image_path: str) -> Image:
     """Create a thumbnail from an image file.
     
@@ -336,12 +725,30 @@ def create_thumbnail(image_path: str) -> Image:
     Example:
         create_thumbnail("input.jpg") -> Image object
     """
-    print("CALLED: create_thumbnail(image_path: str) -> Image:")
+    from PIL import Image as PILImage
     img = PILImage.open(image_path)
-    img.thumbnail((100, 100))
-    return Image(data=img.tobytes(), format="png")
+    # thumbnail() already has libjpeg downscale JPEGs in the DCT domain via draft()
+    img.thumbnail((100, 100), PILImage.Resampling.BILINEAR)
+    if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return Image(data=buf.getvalue(), format="png")
+
+# Memoized kernels for the pure tools. They return tuples so a cached result can
+# never be mutated; the tools copy them into a fresh list at the boundary.
+@lru_cache(maxsize=128)
+def _ascii_codes(string: str) -> tuple:
+    try:
+        buf = string.encode('latin-1')
+    except UnicodeEncodeError:
+        # Code points above 255 do not fit in one byte; fall back to ord()
+        return tuple(map(ord, string))
+    # Iterating bytes yields CPython's cached small ints straight from C
+    return tuple(buf)
 
 @mcp.tool()
+@traced
 def get_ascii_values(string: str) -> list[int]:
     """Convert a string to its ASCII values. This is the ONLY function to use for ASCII value conversion.
     
@@ -368,11 +775,27 @@ def get_ascii_values(string: str) -> list[int]:
         calculate_ascii_value("ABC")  # ❌ Wrong: wrong function name
         ascii_value("ABC")  # ❌ Wrong: wrong function name
     """
-    print("CALLED: get_ascii_values(string: str) -> list[int]:")
-    return [int(ord(char)) for char in string]
+    return list(_ascii_codes(string))
+
+# Shorter lists are summed inline: array setup and a thread hop would cost more
+EXP_SUM_VECTOR_MIN_LEN = 8
+
+def _exponential_sum(numbers: list) -> float:
+    arr = np.asarray(numbers, dtype=np.float64)
+    _, exp_sum = _numba_kernels()
+    if exp_sum is not None:
+        result = exp_sum(arr)
+    else:
+        with np.errstate(over='ignore'):
+            result = float(np.exp(arr).sum())
+    # math.exp raises instead of returning inf; keep the error the same for both paths
+    if math.isinf(result):
+        raise OverflowError("math range error")
+    return result
 
 @mcp.tool()
-def calculate_exponential_sum(numbers: list) -> float:
+@traced
+async def calculate_exponential_sum(numbers: list) -> float:
     """Calculate the sum of e raised to each number in the input list.
     
     Args:
@@ -384,11 +807,32 @@ def calculate_exponential_sum(numbers: list) -> float:
     Example:
         calculate_exponential_sum([0, 1, 2]) -> 4.718281828459045
     """
-    print("CALLED: calculate_exponential_sum(numbers: list) -> float:")
-    return sum(math.exp(i) for i in numbers)
+    if len(numbers) < EXP_SUM_VECTOR_MIN_LEN:
+        return sum(math.exp(x) for x in numbers)
+    return await asyncio.to_thread(_exponential_sum, numbers)
+
+# Only sequences up to this length are memoized; longer ones would pin their
+# bigints in the cache for the life of the process
+FIB_CACHE_MAX_N = 1000
+
+def _fibonacci_list(n: int) -> tuple:
+    if n > FIB_CACHE_MAX_N:
+        return _build_fibonacci(n)
+    return _cached_fibonacci(n)
+
+def _build_fibonacci(n: int) -> tuple:
+    fib_sequence = [0] * n
+    a, b = 0, 1
+    for i in range(n):
+        fib_sequence[i] = a
+        a, b = b, a + b
+    return tuple(fib_sequence)
+
+_cached_fibonacci = lru_cache(maxsize=64)(_build_fibonacci)
 
 @mcp.tool()
-def generate_fibonacci_sequence(n: int) -> list:
+@traced
+async def generate_fibonacci_sequence(n: int) -> list:
     """Generate the first n numbers in the Fibonacci sequence.
     
     Args:
@@ -400,16 +844,47 @@ def generate_fibonacci_sequence(n: int) -> list:
     Example:
         generate_fibonacci_sequence(5) -> [0, 1, 1, 2, 3]
     """
-    print("CALLED: generate_fibonacci_sequence(n: int) -> list:")
     if n <= 0:
         return []
-    fib_sequence = [0, 1]
-    for _ in range(2, n):
-        fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
-    return fib_sequence[:n]
+    fib_int64, _ = _numba_kernels()
+    if fib_int64 is not None and n <= FIB_INT64_MAX_N:
+        return fib_int64(n).tolist()
+    # Past int64 range the values need Python's arbitrary-precision ints
+    return list(await asyncio.to_thread(_fibonacci_list, n))
+
+def _fib_pair(n: int) -> tuple:
+    """Return (F(n), F(n+1)) by fast doubling: O(log n) big-int multiplications."""
+    if n == 0:
+        return (0, 1)
+    a, b = _fib_pair(n >> 1)
+    c = a * (2 * b - a)  # F(2k)
+    d = a * a + b * b    # F(2k+1)
+    return (d, c + d) if n & 1 else (c, d)
 
 @mcp.tool()
-async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
+@traced
+async def fibonacci_nth(n: int) -> int:
+    """Calculate only the n-th Fibonacci number (F(0) = 0, F(1) = 1).
+    
+    Much faster than generate_fibonacci_sequence for large n when only the
+    last value is needed.
+    
+    Args:
+        n (int): Index of the Fibonacci number, must be non-negative
+        
+    Returns:
+        int: The n-th Fibonacci number
+        
+    Example:
+        fibonacci_nth(10) -> 55
+    """
+    if n < 0:
+        raise ValueError("n must be non-negative")
+    return (await asyncio.to_thread(_fib_pair, n))[0]
+
+@mcp.tool()
+@holds_canvas_lock
+async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> str:
     """Draw a rectangle in Preview from (x1,y1) to (x2,y2).
     
     Args:
@@ -419,315 +894,225 @@ async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
         y2 (int): Ending y-coordinate
         
     Returns:
-        dict: Status message about the drawing operation
+        str: Status message about the drawing operation
     """
-    global preview_is_running, preview_blank_image_path, final_image_path
+    global preview_is_running, preview_blank_image_path, final_image_path, canvas
     
     try:
         # Print a visualization of the rectangle to the console
-        print("\n===== RECTANGLE VISUALIZATION =====")
-        print(f"Rectangle drawn from ({x1},{y1}) to ({x2},{y2})")
-        
-        # Calculate dimensions
         width = abs(x2 - x1)
         height = abs(y2 - y1)
-        print(f"Width: {width}, Height: {height}")
-        
-        # Output a simple ASCII rectangle
-        print("+" + "-" * (min(width // 10, 30)) + "+")
-        for _ in range(min(height // 20, 10)):
-            print("|" + " " * (min(width // 10, 30)) + "|")
-        print("+" + "-" * (min(width // 10, 30)) + "+")
-        print("===================================\n")
+        inner = min(width // 10, 30)
+        border = "+" + "-" * inner + "+"
+        side = "|" + " " * inner + "|"
+        log_stderr("\n".join([
+            "\n===== RECTANGLE VISUALIZATION =====",
+            f"Rectangle drawn from ({x1},{y1}) to ({x2},{y2})",
+            f"Width: {width}, Height: {height}",
+            border,
+            *[side] * min(height // 20, 10),
+            border,
+            "===================================\n",
+        ]))
         
         # Create a new image with PIL directly
         # Use standard 800x600 canvas with white background
-        img = PILImage.new('RGB', (800, 600), color='white')
+        from PIL import Image as PILImage, ImageDraw
+        img = PILImage.new('RGB', CANVAS_SIZE, color='white')
         
         # Draw the rectangle directly on the image
-        from PIL import ImageDraw
         draw = ImageDraw.Draw(img)
         
         # Use the coordinates provided by the client but ensure they're within bounds
-        # Ensure coordinates are within the 800x600 canvas
-        rect_left = max(10, min(x1, 790))
-        rect_top = max(10, min(y1, 590))
-        rect_right = max(10, min(x2, 790))
-        rect_bottom = max(10, min(y2, 590))
+        rect_left, rect_top, rect_right, rect_bottom = clamp_rect(x1, y1, x2, y2)
         
-        print(f"Using adjusted coordinates: ({rect_left},{rect_top}) to ({rect_right},{rect_bottom})")
+        log_stderr(f"Using adjusted coordinates: ({rect_left},{rect_top}) to ({rect_right},{rect_bottom})")
         
         # Draw rectangle with a thick black border (5 pixels)
-        draw.rectangle([(rect_left, rect_top), (rect_right, rect_bottom)], 
-                       outline='black', width=5)
+        draw.rectangle((rect_left, rect_top, rect_right, rect_bottom), outline='black', width=5)
         
         # Save the image to the final output path so we can reuse it
-        temp_dir = tempfile.gettempdir()
-        final_image_path = os.path.join(temp_dir, "final_result.png")
-        img.save(final_image_path)
+        final_image_path = CANVAS_PATH
+        save_canvas(img)
+        canvas = img
         
         # Store the rectangle coordinates for text placement
         global rect_center_x, rect_center_y
         rect_center_x = (rect_left + rect_right) // 2
         rect_center_y = (rect_top + rect_bottom) // 2
         
-        print(f"Rectangle image created and saved to: {final_image_path}")
+        log_stderr(f"Rectangle image created and saved to: {final_image_path}")
         
         # Flag to indicate rectangle was created
         global rectangle_drawn
         rectangle_drawn = True
         
-        # If Preview is already running, replace the current image
-        if preview_is_running:
-            # Close any existing Preview first
-            subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-            await asyncio.sleep(1)
-        
-        # Open the image with Preview
-        subprocess.run(['open', '-a', 'Preview', final_image_path])
-        await asyncio.sleep(2)
-        preview_is_running = True
+        await show_in_preview(final_image_path)
         
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text=f"Rectangle drawn from ({x1},{y1}) to ({x2},{y2})"
-                )
-            ]
-        }
+        return f"Rectangle drawn from ({x1},{y1}) to ({x2},{y2})"
     except Exception as e:
-        print(f"Error in draw_rectangle: {str(e)}")
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text=f"Error drawing rectangle: {str(e)}"
-                )
-            ]
-        }
+        log_stderr(f"Error in draw_rectangle: {str(e)}")
+        return f"Error drawing rectangle: {str(e)}"
 
 # Global variables to track rectangle position and file path
 rect_center_x = None
 rect_center_y = None
 final_image_path = None
 rectangle_drawn = False
+# In-memory copy of the image at final_image_path, so edits skip re-decoding the PNG
+canvas = None
 
 @mcp.tool()
-async def add_text_in_paint(text: str) -> dict:
+@holds_canvas_lock
+async def add_text_in_paint(text: str) -> str:
     """Add text to the Preview canvas. This will place the text inside the previously drawn rectangle.
     
     Args:
         text (str): Text to add to the canvas
         
     Returns:
-        dict: Status message about the text addition
+        str: Status message about the text addition
     """
-    global rectangle_drawn, rect_center_x, rect_center_y, final_image_path, preview_is_running
+    global rectangle_drawn, rect_center_x, rect_center_y, final_image_path, preview_is_running, canvas
     
     try:
         # Print the text visualization to the console
-        print("\n======= TEXT VISUALIZATION =======")
-        print("╔" + "═" * (len(text) + 2) + "╗")
-        print("║ " + text + " ║")
-        print("╚" + "═" * (len(text) + 2) + "╝")
-        print("=================================\n")
-        
-        if rectangle_drawn and final_image_path:
-            # Open the previously created image with rectangle
-            img = PILImage.open(final_image_path)
-            
-            # Add text to the image
-            from PIL import ImageDraw, ImageFont
-            draw = ImageDraw.Draw(img)
-            
-            # Try to load a default system font, or fall back to default
-            try:
-                # Try to use a common system font
-                font_path = '/System/Library/Fonts/Helvetica.ttc'
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, 36)
-                else:
-                    # Use default PIL font if Helvetica not available
-                    font = ImageFont.load_default()
-            except Exception:
-                # Fall back to default if any issues loading font
-                font = ImageFont.load_default()
-            
-            # Center the text in the rectangle
-            text_width = draw.textlength(text, font=font)
-            text_x = rect_center_x - (text_width // 2)
-            text_y = rect_center_y - 18  # Approx half the font height
-            
-            # Draw text with black color
-            draw.text((text_x, text_y), text, fill='black', font=font)
-            
-            # Overwrite the same image file
-            img.save(final_image_path)
-            
-            print(f"Text '{text}' added to image at: {final_image_path}")
-            
-            # Close Preview and reopen with the updated image
-            if preview_is_running:
-                # Close any existing Preview first
-                subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-                await asyncio.sleep(1)
-                
-                # Reopen Preview with the updated image
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
-            else:
-                # If Preview wasn't running, just open it
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
-            
-            return {
-                "content": [
-                    TextContent(
-                        type="text",
-                        text=f"Text:'{text}' added successfully and displayed in Preview"
-                    )
-                ]
-            }
+        bar = "═" * (len(text) + 2)
+        log_stderr(f"\n======= TEXT VISUALIZATION =======\n╔{bar}╗\n║ {text} ║\n╚{bar}╝\n"
+                   "=================================\n")
+        
+        from PIL import Image as PILImage, ImageDraw
+        
+        in_rectangle = bool(rectangle_drawn and final_image_path)
+        if in_rectangle:
+            # Draw on the previously created image with rectangle
+            img = canvas if canvas is not None else PILImage.open(final_image_path)
+            center = (rect_center_x, rect_center_y)
         else:
             # If no rectangle has been drawn, create a new image with just the text
-            img = PILImage.new('RGB', (800, 600), color='white')
-            draw = ImageDraw.Draw(img)
-            
-            # Try to load a default system font, or fall back to default
-            try:
-                # Try to use a common system font
-                font_path = '/System/Library/Fonts/Helvetica.ttc'
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, 36)
-                else:
-                    # Use default PIL font if Helvetica not available
-                    font = ImageFont.load_default()
-            except Exception:
-                # Fall back to default if any issues loading font
-                font = ImageFont.load_default()
-            
-            # Center the text in the image
-            text_width = draw.textlength(text, font=font)
-            text_x = 400 - (text_width // 2)
-            text_y = 300 - 18  # Approx half the font height
-            
-            # Draw text with black color
-            draw.text((text_x, text_y), text, fill='black', font=font)
-            
-            # Save the image to the final output path
-            temp_dir = tempfile.gettempdir()
-            final_image_path = os.path.join(temp_dir, "final_result.png")
-            img.save(final_image_path)
-            
-            # Close and reopen Preview with the new image
-            if preview_is_running:
-                # Close any existing Preview first
-                subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-                await asyncio.sleep(1)
-                
-                # Reopen Preview with the updated image
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
-            else:
-                # If Preview wasn't running, just open it
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
-            
-            print(f"Text '{text}' added to a new image at: {final_image_path}")
-            
-            return {
-                "content": [
-                    TextContent(
-                        type="text",
-                        text=f"Text:'{text}' added to a new image (no rectangle was drawn first)"
-                    )
-                ]
-            }
+            img = PILImage.new('RGB', CANVAS_SIZE, color='white')
+            center = (CANVAS_SIZE[0] // 2, CANVAS_SIZE[1] // 2)
+        
+        render_text(ImageDraw.Draw(img), text, *center)
+        
+        # Overwrite the canvas file, then close Preview and reopen it with the update
+        final_image_path = CANVAS_PATH
+        save_canvas(img)
+        canvas = img
+        await show_in_preview(final_image_path)
+        
+        log_stderr(f"Text '{text}' added to image at: {final_image_path}")
+        
+        if in_rectangle:
+            return f"Text:'{text}' added successfully and displayed in Preview"
+        return f"Text:'{text}' added to a new image (no rectangle was drawn first)"
     except Exception as e:
-        print(f"Error in add_text_in_paint: {str(e)}")
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text=f"Error adding text: {str(e)}"
-                )
-            ]
-        }
+        log_stderr(f"Error in add_text_in_paint: {str(e)}")
+        return f"Error adding text: {str(e)}"
 
 @mcp.tool()
-async def open_paint() -> dict:
+@holds_canvas_lock
+async def draw_scene(x1: int, y1: int, x2: int, y2: int, text: str) -> str:
+    """Draw a rectangle and write text centered inside it in a single Preview update.
+
+    Prefer this over calling draw_rectangle and then add_text_in_paint: the
+    canvas is rendered once and Preview is only reopened once.
+
+    Args:
+        x1 (int): Starting x-coordinate
+        y1 (int): Starting y-coordinate
+        x2 (int): Ending x-coordinate
+        y2 (int): Ending y-coordinate
+        text (str): Text to write inside the rectangle
+
+    Returns:
+        str: Status message about the drawing operation
+    """
+    global preview_is_running, final_image_path, rect_center_x, rect_center_y, rectangle_drawn, canvas
+
+    try:
+        from PIL import Image as PILImage, ImageDraw
+        img = PILImage.new('RGB', CANVAS_SIZE, color='white')
+        draw = ImageDraw.Draw(img)
+
+        # Ensure coordinates are within the 800x600 canvas
+        rect_left, rect_top, rect_right, rect_bottom = clamp_rect(x1, y1, x2, y2)
+
+        draw.rectangle((rect_left, rect_top, rect_right, rect_bottom), outline='black', width=5)
+        rect_center_x = (rect_left + rect_right) // 2
+        rect_center_y = (rect_top + rect_bottom) // 2
+
+        render_text(draw, text, rect_center_x, rect_center_y)
+
+        final_image_path = CANVAS_PATH
+        save_canvas(img)
+        canvas = img
+        rectangle_drawn = True
+
+        log_stderr(f"Scene with rectangle ({rect_left},{rect_top})-({rect_right},{rect_bottom}) "
+                   f"and text '{text}' saved to: {final_image_path}")
+
+        # Show the finished canvas with a single Preview reload
+        await show_in_preview(final_image_path)
+
+        return f"Rectangle drawn from ({x1},{y1}) to ({x2},{y2}) with text:'{text}' inside"
+    except Exception as e:
+        log_stderr(f"Error in draw_scene: {str(e)}")
+        return f"Error drawing scene: {str(e)}"
+
+@mcp.tool()
+@holds_canvas_lock
+async def open_paint() -> str:
     """Open Preview on macOS with a new blank document.
     
     Returns:
-        dict: Status message about the Preview opening operation
+        str: Status message about the Preview opening operation
     """
-    global preview_is_running, final_image_path
+    global preview_is_running, final_image_path, canvas
     
     try:
-        print("Starting open_paint function...")
-        
-        # Create a blank white image
-        img = PILImage.new('RGB', (800, 600), color='white')
+        log_stderr("Starting open_paint function...")
         
-        # Save to temp directory
-        temp_dir = tempfile.gettempdir()
-        final_image_path = os.path.join(temp_dir, "final_result.png")
-        img.save(final_image_path)
+        # Copy the prebuilt blank canvas to the temp directory; later tools overwrite it
+        final_image_path = CANVAS_PATH
+        shutil.copyfile(BLANK_CANVAS_PATH, final_image_path)
+        canvas = None
         
-        print(f"Blank canvas created at: {final_image_path}")
+        log_stderr(f"Blank canvas created at: {final_image_path}")
         
         # Force close any existing Preview to start fresh
-        subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-        await asyncio.sleep(1)
+        await quit_preview()
         
-        # Open the blank image with Preview
-        subprocess.run(['open', '-a', 'Preview', final_image_path])
-        await asyncio.sleep(2)
+        # Open the blank image with Preview and wait for its window
+        await run_command('open', '-a', 'Preview', final_image_path)
+        if not await await_preview_window():
+            log_stderr("Preview window did not appear within timeout")
         
         # Set flag indicating Preview is running
         preview_is_running = True
         
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text="Preview opened with a blank canvas"
-                )
-            ]
-        }
+        return "Preview opened with a blank canvas"
     except Exception as e:
         preview_is_running = False
         error_msg = str(e)
-        print(f"Error in open_paint: {error_msg}")
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text=f"Error opening Preview: {error_msg}"
-                )
-            ]
-        }
+        log_stderr(f"Error in open_paint: {error_msg}")
+        return f"Error opening Preview: {error_msg}"
 
 # DEFINE RESOURCES
 
 # Add a dynamic greeting resource
 @mcp.resource("greeting://{name}")
+@traced
 def get_greeting(name: str) -> str:
     """Get a personalized greeting"""
-    print("CALLED: get_greeting(name: str) -> str:")
     return f"Hello, {name}!"
 
 
 # DEFINE AVAILABLE PROMPTS
 @mcp.prompt()
+@traced
 def review_code(code: str) -> str:
     return f"Please review this code:\n\n{code}"
-    print("CALLED: review_code(code: str) -> str:")
 
 
 @mcp.prompt()
@@ -739,7 +1124,7 @@ def debug_error(error: str) -> list[base.Message]:
     ]
 
 @mcp.tool()
-async def send_email(to_email: str, subject: str, body: str, image_path: str = None) -> dict:
+def send_email(to_email: str, subject: str, body: str, image_path: str = None) -> dict:
     """Send an email using Gmail API with OAuth2 authentication.
     
     Args:
@@ -777,28 +1162,14 @@ async def send_email(to_email: str, subject: str, body: str, image_path: str = N
         message = {'raw': raw_message}
         service.users().messages().send(userId='me', body=message).execute()
 
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text=f"Email sent successfully to {to_email}"
-                )
-            ]
-        }
+        return text_response(f"Email sent successfully to {to_email}")
     except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text=f"Error sending email: {str(e)}"
-                )
-            ]
-        }
+        log_stderr(f"Error sending email: {str(e)}")
+        return text_response(f"Error sending email: {str(e)}")
 
 if __name__ == "__main__":
     # Check if running with mcp dev command
-    print("STARTING")
+    log_stderr("STARTING")
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run()  # Run without transport for dev server
     else:
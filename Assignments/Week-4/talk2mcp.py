@@ -2,10 +2,16 @@ import os
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
+from contextlib import AsyncExitStack
 import asyncio
+import logging
+import re
+import traceback
 import google.generativeai as genai
-from concurrent.futures import TimeoutError
-from functools import partial
+from concurrent.futures import TimeoutError, ThreadPoolExecutor
+from functools import partial, lru_cache
+from collections import deque
+from string import Template
 import subprocess
 import time
 from fastmcp import FastMCP
@@ -13,6 +19,11 @@ from fastmcp import FastMCP
 # Load environment variables from .env file
 load_dotenv()
 
+# Per-step DEBUG tracing; run with LOGLEVEL=DEBUG to see it. When disabled the
+# messages are never formatted.
+logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
+log = logging.getLogger(__name__)
+
 # Access your API key and initialize Gemini client correctly
 api_key = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=api_key)
@@ -53,26 +64,59 @@ model = genai.GenerativeModel('gemini-2.0-flash-001',  # Using the correct model
     ]
 )
 
+# Dedicated threads for the blocking Gemini SDK calls, kept warm across iterations
+gemini_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gemini")
+
 max_iterations = 6
-last_response = None
-iteration = 0
-iteration_response = []
+# Only the most recent steps are replayed to the model on each iteration
+max_history_steps = 20
+
+# Lines the agent acts on. Streaming stops at a FINAL_ANSWER line or at the end of
+# the first run of consecutive FUNCTION_CALL lines; anything after is ignored
+ACTION_PREFIXES = ("FUNCTION_CALL:", "FINAL_ANSWER:")
+# Every FUNCTION_CALL line in a reply, without its surrounding whitespace
+FUNCTION_CALL_RE = re.compile(r"^\s*(FUNCTION_CALL:.*?)\s*$", re.MULTILINE)
+# Splits "name|a|b" and strips each part in the same pass
+PIPE_SPLIT_RE = re.compile(r"\s*\|\s*")
+
+def stream_until_action(prompt):
+    """Stream the model's reply and stop once its action lines are complete.
+
+    Returns a FINAL_ANSWER line, the run of consecutive FUNCTION_CALL lines
+    joined by newlines, or the whole reply if no complete action line arrived.
+    """
+    text = ""
+    scanned = 0
+    calls = []
+    for chunk in model.generate_content(prompt, stream=True):
+        text += chunk.text
+        # Only finished lines are checked, a partial one may still be growing
+        while (end := text.find("\n", scanned)) != -1:
+            line = text[scanned:end].strip()
+            scanned = end + 1
+            if line.startswith("FUNCTION_CALL:"):
+                calls.append(line)
+            elif calls:
+                return "\n".join(calls)  # The batch ended, ignore what follows
+            elif line.startswith(ACTION_PREFIXES):
+                return line
+    if calls:
+        tail = text[scanned:].strip()
+        if tail.startswith("FUNCTION_CALL:"):
+            calls.append(tail)
+        return "\n".join(calls)
+    return text
 
 async def generate_with_timeout(client, prompt, timeout=10):
-    """Generate content with a timeout"""
+    """Generate content with a timeout, returning the response text"""
     print("Starting LLM generation...")
     try:
-        # Convert the synchronous generate_content call to run in a thread
-        loop = asyncio.get_event_loop()
-        response = await asyncio.wait_for(
-            loop.run_in_executor(
-                None, 
-                lambda: model.generate_content(prompt)
-            ),
-            timeout=timeout
-        )
+        # Convert the synchronous streaming call to run in a thread
+        loop = asyncio.get_running_loop()
+        async with asyncio.timeout(timeout):
+            response_text = await loop.run_in_executor(gemini_pool, stream_until_action, prompt)
         print("LLM generation completed")
-        return response
+        return response_text
     except TimeoutError:
         print("LLM generation timed out!")
         raise
@@ -80,92 +124,31 @@ async def generate_with_timeout(client, prompt, timeout=10):
         print(f"Error in LLM generation: {e}")
         raise
 
-def reset_state():
-    """Reset all global variables to their initial state"""
-    global last_response, iteration, iteration_response
-    last_response = None
-    iteration = 0
-    iteration_response = []
+def parse_array(value, item=int):
+    """Parse an array parameter such as "[1, 2, 3]" into a list of item (ints by default)"""
+    if isinstance(value, str):
+        value = value.strip('[]')
+        if not value.strip():
+            return []
+        value = value.split(',')
+    # int()/float() ignore surrounding whitespace, and map runs the conversion loop in C
+    return list(map(item, value))
 
-async def main():
-    reset_state()  # Reset at the start of main
-    print("Starting main execution...")
-    try:
-        # Create a single MCP server connection
-        print("Establishing connection to MCP server...")
-        server_params = StdioServerParameters(
-            command="python",
-            args=["mcp-server.py"]
-        )
+# Parameter converters keyed by JSON schema type; unknown types are passed as strings
+CONVERTERS = {
+    'integer': int,
+    'number': float,
+    'array': parse_array,
+    'array[number]': partial(parse_array, item=float),
+    'string': str,
+}
 
-        async with stdio_client(server_params) as (read, write):
-            print("Connection established, creating session...")
-            async with ClientSession(read, write) as session:
-                print("Session created, initializing...")
-                await session.initialize()
-                
-                # Get available tools
-                print("Requesting tool list...")
-                tools_result = await session.list_tools()
-                tools = tools_result.tools
-                print(f"Successfully retrieved {len(tools)} tools")
-
-                # Create system prompt with available tools
-                print("Creating system prompt...")
-                print(f"Number of tools: {len(tools)}")
-                
-                try:
-                    # First, let's inspect what a tool object looks like
-                    # if tools:
-                    #     print(f"First tool properties: {dir(tools[0])}")
-                    #     print(f"First tool example: {tools[0]}")
-                    
-                    tools_description = []
-                    for i, tool in enumerate(tools):
-                        try:
-                            # Get tool properties
-                            params = tool.inputSchema
-                            desc = getattr(tool, 'description', 'No description available')
-                            name = getattr(tool, 'name', f'tool_{i}')
-                            
-                            # Format the input schema in a more readable way
-                            if 'properties' in params:
-                                param_details = []
-                                for param_name, param_info in params['properties'].items():
-                                    param_type = param_info.get('type', 'unknown')
-                                    param_details.append(f"{param_name}: {param_type}")
-                                params_str = ', '.join(param_details)
-                            else:
-                                params_str = 'no parameters'
-
-                            tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
-                            tools_description.append(tool_desc)
-                            print(f"Added description for tool: {tool_desc}")
-                        except Exception as e:
-                            print(f"Error processing tool {i}: {e}")
-                            tools_description.append(f"{i+1}. Error processing tool")
-                    
-                    tools_description = "\n".join(tools_description)
-                    print("Successfully created tools description")
-                    
-                    # Create a simple list of available tool names for quick reference
-                    available_tool_names = [tool.name for tool in tools]
-                    available_tools_list = ", ".join(available_tool_names)
-                    print(f"Available tools list: {available_tools_list}")
-                    
-                except Exception as e:
-                    print(f"Error creating tools description: {e}")
-                    tools_description = "Error loading tools"
-                    available_tools_list = "Error loading tool names"
-                
-                print("Created system prompt...")
-                
-                # System prompt for the agent
-                SYSTEM_PROMPT = f"""You are an autonomous agent that can perform mathematical calculations and display results using Preview on macOS. You have access to ONLY these specific tools:
-
-{tools_description}
-
-AVAILABLE TOOLS (use ONLY these exact names): {available_tools_list}
+# The agent's system prompt; only the tool listing varies between servers
+SYSTEM_PROMPT_TEMPLATE = Template("""You are an autonomous agent that can perform mathematical calculations and display results using Preview on macOS. You have access to ONLY these specific tools:
+
+${tools_description}
+
+AVAILABLE TOOLS (use ONLY these exact names): ${available_tools_list}
 
 Your task is to:
 1. Analyze the user's request carefully
@@ -183,10 +166,12 @@ Important Guidelines:
    - Use the EXACT function names from the tools list - no variations allowed
 
 2. Response Format:
-   You must respond with EXACTLY ONE line in one of these formats (no additional text):
-   1. For function calls:
+   You must respond with lines in one of these formats only (no additional text):
+   1. For function calls, one line per call:
       FUNCTION_CALL: function_name|param1|param2|...
-   2. For final answers:
+      Usually send a single call. If several calls do not need each other's results, you may send them together,
+      one FUNCTION_CALL line each; they are run in the order given.
+   2. For final answers, exactly one line on its own:
       FINAL_ANSWER: [message]
 
    IMPORTANT PARAMETER FORMATTING RULES:
@@ -194,7 +179,7 @@ Important Guidelines:
    - Parameters must be raw values without variable names or prefixes
 
    DO NOT include any explanations or additional text.
-   Your entire response should be a single line starting with either FUNCTION_CALL: or FINAL_ANSWER:
+   Your entire response should be FUNCTION_CALL: lines or a single line starting with FINAL_ANSWER:
 
 3. Best Practices:
    - If you get an "Unknown tool" error, check the AVAILABLE TOOLS list and use the exact function name
@@ -207,9 +192,254 @@ Remember:
 - ALWAYS verify function names against the AVAILABLE TOOLS list
 - Plan your sequence of operations before executing
 - Handle errors gracefully and provide clear feedback
-"""
+""")
+
+@lru_cache(maxsize=8)
+def build_system_prompt(tools_description, available_tools_list):
+    """Render the agent's system prompt; cached since the tool list is fixed per server"""
+    return SYSTEM_PROMPT_TEMPLATE.substitute(
+        tools_description=tools_description,
+        available_tools_list=available_tools_list,
+    )
+
+# The server process is started once and shared by every query
+server_params = StdioServerParameters(
+    command="python",
+    args=["mcp-server.py"]
+)
+
+class MCPClient:
+    """A single stdio session with the MCP server, reused across queries.
+
+    The tool list, and everything derived from it, is fetched once on connect
+    since it does not change while the server is running.
+    """
 
-                query = """Find the ASCII values of characters in the word "INDIA", then calculate the sum of exponentials of those ASCII values. Open paint, draw a rectangle that fits and write the final answer within this rectangle.
+    def __init__(self, server_params):
+        self.server_params = server_params
+        self._stack = None
+        self.session = None
+
+    async def __aenter__(self):
+        self._stack = AsyncExitStack()
+        try:
+            print("Establishing connection to MCP server...")
+            read, write = await self._stack.enter_async_context(stdio_client(self.server_params))
+            print("Connection established, creating session...")
+            self.session = await self._stack.enter_async_context(ClientSession(read, write))
+            print("Session created, initializing...")
+            await self.session.initialize()
+            await self._load_tools()
+        except BaseException:
+            await self._stack.aclose()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stack.aclose()
+
+    @staticmethod
+    def _param_specs(schema):
+        required = frozenset(schema.get('required', ()))
+        return tuple(
+            (name, MCPClient._param_type(info), name in required)
+            for name, info in schema.get('properties', {}).items()
+        )
+
+    @staticmethod
+    def _param_type(info):
+        """CONVERTERS key for one parameter; float arrays get their own converter"""
+        param_type = info.get('type', 'string')
+        if param_type == 'array' and info.get('items', {}).get('type') == 'number':
+            return 'array[number]'
+        return param_type
+
+    async def _load_tools(self):
+        # Get available tools
+        print("Requesting tool list...")
+        tools_result = await self.session.list_tools()
+        self.tools = tools = tools_result.tools
+        print(f"Successfully retrieved {len(tools)} tools")
+
+        # Index the tools once so each iteration does a dict lookup instead of a scan
+        self.tools_by_name = {t.name: t for t in tools}
+        # (name, type, required) for every parameter, in schema order
+        self.tool_param_specs = {t.name: self._param_specs(t.inputSchema) for t in tools}
+
+        # Create system prompt with available tools
+        print("Creating system prompt...")
+        print(f"Number of tools: {len(tools)}")
+        
+        try:
+            # First, let's inspect what a tool object looks like
+            # if tools:
+            #     print(f"First tool properties: {dir(tools[0])}")
+            #     print(f"First tool example: {tools[0]}")
+            
+            tools_description = "\n".join(
+                "{}. {}({}) - {}".format(
+                    i + 1,
+                    tool.name,
+                    ", ".join(
+                        f"{param_name}: {param_info.get('type', 'unknown')}"
+                        for param_name, param_info in tool.inputSchema.get('properties', {}).items()
+                    ) or "no parameters",
+                    tool.description or 'No description available',
+                )
+                for i, tool in enumerate(tools)
+            )
+            log.debug("Tools description:\n%s", tools_description)
+            print("Successfully created tools description")
+            
+            # Create a simple list of available tool names for quick reference
+            available_tool_names = [tool.name for tool in tools]
+            available_tools_list = ", ".join(available_tool_names)
+            print(f"Available tools list: {available_tools_list}")
+            
+        except Exception as e:
+            print(f"Error creating tools description: {e}")
+            tools_description = "Error loading tools"
+            available_tools_list = "Error loading tool names"
+        
+        print("Created system prompt...")
+        self.tools_description = tools_description
+        self.available_tools_list = available_tools_list
+
+async def call_function(client, function_call):
+    """Run one FUNCTION_CALL line on the server.
+
+    Returns (func_name, arguments, result), raising ValueError for an unknown
+    tool or missing parameters.
+    """
+    _, function_info = function_call.split(":", 1)
+    parts = PIPE_SPLIT_RE.split(function_info.strip())
+    func_name, params = parts[0], parts[1:]
+
+    log.debug("Raw function info: %s", function_info)
+    log.debug("Split parts: %s", parts)
+    log.debug("Function name: %s", func_name)
+    log.debug("Raw parameters: %s", params)
+
+    # Find the matching tool to get its input schema
+    tool = client.tools_by_name.get(func_name)
+    if not tool:
+        log.debug("Available tools: %s", client.available_tools_list)
+        error_msg = f"Unknown tool: {func_name}. Available tools are: {client.available_tools_list}"
+        log.debug("%s", error_msg)
+        raise ValueError(error_msg)
+
+    log.debug("Found tool: %s", tool.name)
+    log.debug("Tool schema: %s", tool.inputSchema)
+
+    # Prepare arguments according to the tool's input schema
+    specs = client.tool_param_specs[func_name]
+    # Only optional parameters may be left out, wherever they sit after the last value
+    missing = [name for name, _, required in specs[len(params):] if required]
+    if missing:
+        raise ValueError(f"Not enough parameters provided for {func_name}: missing {', '.join(missing)}")
+
+    # Convert each value to the type given by the schema; zip stops
+    # at whichever runs out first
+    arguments = {
+        param_name: CONVERTERS.get(param_type, str)(value)
+        for (param_name, param_type, _), value in zip(specs, params)
+    }
+
+    log.debug("Final arguments: %s", arguments)
+    log.debug("Calling tool %s", func_name)
+
+    result = await client.session.call_tool(func_name, arguments=arguments)
+    log.debug("Raw result: %s", result)
+
+    # Get the full result content
+    if hasattr(result, 'content'):
+        log.debug("Result has content attribute")
+        # Handle multiple content items
+        if isinstance(result.content, list):
+            iteration_result = [
+                item.text if hasattr(item, 'text') else str(item)
+                for item in result.content
+            ]
+        else:
+            iteration_result = str(result.content)
+    else:
+        log.debug("Result has no content attribute")
+        iteration_result = str(result)
+
+    log.debug("Final iteration result: %s", iteration_result)
+    return func_name, arguments, iteration_result
+
+async def run_query(client, query):
+    """Run the agent loop for one query over an already connected client"""
+    # Every query starts from a clean history
+    iteration = 0
+    last_response = None
+    iteration_response = deque(maxlen=max_history_steps)
+    available_tools_list = client.available_tools_list
+
+    # System prompt for the agent
+    SYSTEM_PROMPT = build_system_prompt(client.tools_description, available_tools_list)
+
+    print("Starting iteration loop...")
+    
+    # The system prompt and query never change, so build that prefix once
+    prompt_prefix = f"{SYSTEM_PROMPT}\n\nQuery: {query}"
+    
+    while iteration < max_iterations:
+        print(f"\n--- Iteration {iteration + 1} ---")
+        if last_response is None:
+            prompt = prompt_prefix
+        else:
+            prompt = f"{prompt_prefix}\n\n{' '.join(iteration_response)}  What should I do next?"
+
+        # Get model's response with timeout
+        print("Preparing to generate LLM response...")
+        try:
+            response_text = (await generate_with_timeout(model, prompt)).strip()
+            print(f"LLM Response: {response_text}")
+            
+        except Exception as e:
+            print(f"Failed to get LLM response: {e}")
+            break
+
+
+        function_calls = FUNCTION_CALL_RE.findall(response_text)
+        if function_calls:
+            try:
+                # Run in order, a later call may draw on what an earlier one drew
+                for function_call in function_calls:
+                    func_name, arguments, iteration_result = await call_function(client, function_call)
+
+                    # Format the response based on result type
+                    if isinstance(iteration_result, list):
+                        result_str = f"[{', '.join(iteration_result)}]"
+                    else:
+                        result_str = str(iteration_result)
+
+                    iteration_response.append(
+                        f"In the {iteration + 1} iteration you called {func_name} with {arguments} parameters, "
+                        f"and the function returned {result_str}."
+                    )
+                    last_response = iteration_result
+
+            except Exception as e:
+                # The message is logged and goes into the history; the traceback only at DEBUG
+                log.error("Iteration %d failed: %s", iteration + 1, e)
+                log.debug("Iteration %d traceback", iteration + 1, exc_info=True)
+                iteration_response.append(f"Error in iteration {iteration + 1}: {str(e)}")
+                break
+
+        elif response_text.startswith("FINAL_ANSWER:"):
+            print("\n=== Agent Execution Complete ===")
+            print(f"Final answer: {response_text}")
+            break
+
+        iteration += 1
+
+async def main():
+    print("Starting main execution...")
+    try:
+        query = """Find the ASCII values of characters in the word "INDIA", then calculate the sum of exponentials of those ASCII values. Open paint, draw a rectangle that fits and write the final answer within this rectangle.
 
 Make sure to:
 - Choose the appropriate functions from the available tools list
@@ -217,144 +447,12 @@ Make sure to:
 - Wait for each operation to complete before proceeding to the next
 - Format parameters correctly (use arrays in [value1, value2] format, not variable assignments)
 """
-                print("Starting iteration loop...")
-                
-                # Use global iteration variables
-                global iteration, last_response
-                
-                while iteration < max_iterations:
-                    print(f"\n--- Iteration {iteration + 1} ---")
-                    if last_response is None:
-                        current_query = query
-                    else:
-                        current_query = current_query + "\n\n" + " ".join(iteration_response)
-                        current_query = current_query + "  What should I do next?"
-
-                    # Get model's response with timeout
-                    print("Preparing to generate LLM response...")
-                    prompt = f"{SYSTEM_PROMPT}\n\nQuery: {current_query}"
-                    try:
-                        response = await generate_with_timeout(model, prompt)
-                        response_text = response.text.strip()
-                        print(f"LLM Response: {response_text}")
-                        
-                        # Find the FUNCTION_CALL line in the response
-                        for line in response_text.split('\n'):
-                            line = line.strip()
-                            if line.startswith("FUNCTION_CALL:"):
-                                response_text = line
-                                break
-                        
-                    except Exception as e:
-                        print(f"Failed to get LLM response: {e}")
-                        break
-
-
-                    if response_text.startswith("FUNCTION_CALL:"):
-                        _, function_info = response_text.split(":", 1)
-                        parts = [p.strip() for p in function_info.split("|")]
-                        func_name, params = parts[0], parts[1:]
-                        
-                        print(f"\nDEBUG: Raw function info: {function_info}")
-                        print(f"DEBUG: Split parts: {parts}")
-                        print(f"DEBUG: Function name: {func_name}")
-                        print(f"DEBUG: Raw parameters: {params}")
-                        
-                        try:
-                            # Find the matching tool to get its input schema
-                            tool = next((t for t in tools if t.name == func_name), None)
-                            if not tool:
-                                print(f"DEBUG: Available tools: {[t.name for t in tools]}")
-                                error_msg = f"Unknown tool: {func_name}. Available tools are: {available_tools_list}"
-                                print(f"DEBUG: {error_msg}")
-                                raise ValueError(error_msg)
-
-                            print(f"DEBUG: Found tool: {tool.name}")
-                            print(f"DEBUG: Tool schema: {tool.inputSchema}")
-
-                            # Prepare arguments according to the tool's input schema
-                            arguments = {}
-                            schema_properties = tool.inputSchema.get('properties', {})
-                            print(f"DEBUG: Schema properties: {schema_properties}")
-
-                            for param_name, param_info in schema_properties.items():
-                                if not params:  # Check if we have enough parameters
-                                    raise ValueError(f"Not enough parameters provided for {func_name}")
-                                    
-                                value = params.pop(0)  # Get and remove the first parameter
-                                param_type = param_info.get('type', 'string')
-                                
-                                print(f"DEBUG: Converting parameter {param_name} with value {value} to type {param_type}")
-                                
-                                # Convert the value to the correct type based on the schema
-                                if param_type == 'integer':
-                                    arguments[param_name] = int(value)
-                                elif param_type == 'number':
-                                    arguments[param_name] = float(value)
-                                elif param_type == 'array':
-                                    # Handle array input
-                                    if isinstance(value, str):
-                                        value = value.strip('[]').split(',')
-                                    arguments[param_name] = [int(x.strip()) for x in value]
-                                else:
-                                    arguments[param_name] = str(value)
-
-                            print(f"DEBUG: Final arguments: {arguments}")
-                            print(f"DEBUG: Calling tool {func_name}")
-                            
-                            result = await session.call_tool(func_name, arguments=arguments)
-                            print(f"DEBUG: Raw result: {result}")
-                            
-                            # Get the full result content
-                            if hasattr(result, 'content'):
-                                print(f"DEBUG: Result has content attribute")
-                                # Handle multiple content items
-                                if isinstance(result.content, list):
-                                    iteration_result = [
-                                        item.text if hasattr(item, 'text') else str(item)
-                                        for item in result.content
-                                    ]
-                                else:
-                                    iteration_result = str(result.content)
-                            else:
-                                print(f"DEBUG: Result has no content attribute")
-                                iteration_result = str(result)
-                                
-                            print(f"DEBUG: Final iteration result: {iteration_result}")
-                            
-                            # Format the response based on result type
-                            if isinstance(iteration_result, list):
-                                result_str = f"[{', '.join(iteration_result)}]"
-                            else:
-                                result_str = str(iteration_result)
-                            
-                            iteration_response.append(
-                                f"In the {iteration + 1} iteration you called {func_name} with {arguments} parameters, "
-                                f"and the function returned {result_str}."
-                            )
-                            last_response = iteration_result
-
-                        except Exception as e:
-                            print(f"DEBUG: Error details: {str(e)}")
-                            print(f"DEBUG: Error type: {type(e)}")
-                            import traceback
-                            traceback.print_exc()
-                            iteration_response.append(f"Error in iteration {iteration + 1}: {str(e)}")
-                            break
-
-                    elif response_text.startswith("FINAL_ANSWER:"):
-                        print("\n=== Agent Execution Complete ===")
-                        print(f"Final answer: {response_text}")
-                        break
-
-                    iteration += 1
+        async with MCPClient(server_params) as client:
+            await run_query(client, query)
 
     except Exception as e:
         print(f"Error in main execution: {e}")
-        import traceback
         traceback.print_exc()
-    finally:
-        reset_state()  # Reset at the end of main
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -3,30 +3,39 @@ from mcp.server.fastmcp import FastMCP, Image
 from mcp.server.fastmcp.prompts import base
 from mcp.types import TextContent
 from mcp import types
-from PIL import Image as PILImage
+from PIL import Image as PILImage, ImageDraw, ImageFont
 import math
+import numpy as np
 import sys
 import pyautogui
-import subprocess
 import time
 import asyncio
 import os
 import tempfile
+import warnings
+import PIL
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 import base64
+from io import BytesIO
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 import json
+import re
 import smtplib
 from typing import Any, Tuple
+from functools import lru_cache
 
 # instantiate an MCP server client
 mcp = FastMCP("Calculator")
 
+# Pillow-SIMD releases carry a ".postN" suffix; plain Pillow resizes several times slower
+if ".post" not in PIL.__version__:
+    warnings.warn("Pillow-SIMD not installed - thumbnails will be slower (pip install pillow-simd)")
+
 # Global flag to track if Preview is already running
 preview_is_running = False
 preview_blank_image_path = None
@@ -36,8 +45,27 @@ SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 TOKEN_FILE = 'token.json'
 CREDENTIALS_FILE = 'credentials.json'
 
+# The Gmail client is built once per process and reused by every send_email
+_gmail_creds = None
+_gmail_service = None
+
+def save_gmail_token(creds):
+    """Persist credentials so the next process can skip the OAuth flow."""
+    with open(TOKEN_FILE, 'w') as token:
+        token.write(creds.to_json())
+
 def get_gmail_service():
     """Get Gmail service using OAuth2 credentials."""
+    global _gmail_creds, _gmail_service
+
+    if _gmail_service is not None:
+        # The client holds on to the same credentials object, so an expired
+        # token only needs refreshing in place, not a new client
+        if not _gmail_creds.valid and _gmail_creds.refresh_token:
+            _gmail_creds.refresh(Request())
+            save_gmail_token(_gmail_creds)
+        return _gmail_service
+
     creds = None
     
     # Load token from file if it exists
@@ -56,10 +84,13 @@ def get_gmail_service():
             creds = flow.run_local_server(port=0)
         
         # Save credentials for future use
-        with open(TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
+        save_gmail_token(creds)
     
-    return build('gmail', 'v1', credentials=creds)
+    # cache_discovery=False: the discovery document is fetched once for this
+    # process anyway, and the file cache only logs warnings on newer oauth2client
+    _gmail_service = build('gmail', 'v1', credentials=creds, cache_discovery=False)
+    _gmail_creds = creds
+    return _gmail_service
 
 # DEFINE TOOLS
 
@@ -167,8 +198,23 @@ def power(a: int, b: int) -> int:
         power(2, 3) -> 8
     """
     print("CALLED: power(a: int, b: int) -> int:")
+    return _power(a, b)
+
+# Large exponents are the expensive case, and the agent tends to repeat calls.
+# Results bigger than this are recomputed instead of memoized, so the cache can
+# hold at most 1024 results of about 512 bytes each
+POWER_CACHE_MAX_BITS = 4096
+
+def _power(a: int, b: int) -> int:
+    if b > 0 and b * abs(a).bit_length() > POWER_CACHE_MAX_BITS:
+        return _compute_power(a, b)
+    return _cached_power(a, b)
+
+def _compute_power(a: int, b: int) -> int:
     return int(a ** b)
 
+_cached_power = lru_cache(maxsize=1024)(_compute_power)
+
 # square root tool
 @mcp.tool()
 def sqrt(a: int) -> float:
@@ -218,8 +264,21 @@ def factorial(a: int) -> int:
         factorial(5) -> 120
     """
     print("CALLED: factorial(a: int) -> int:")
+    return _factorial(a)
+
+# 500! is about 3700 bits; larger factorials are recomputed instead of memoized
+FACTORIAL_CACHE_MAX_N = 500
+
+def _factorial(a: int) -> int:
+    if a > FACTORIAL_CACHE_MAX_N:
+        return _compute_factorial(a)
+    return _cached_factorial(a)
+
+def _compute_factorial(a: int) -> int:
     return int(math.factorial(a))
 
+_cached_factorial = lru_cache(maxsize=1024)(_compute_factorial)
+
 # log tool
 @mcp.tool()
 def log(a: int) -> float:
@@ -339,8 +398,16 @@ def create_thumbnail(image_path: str) -> Image:
     """
     print("CALLED: create_thumbnail(image_path: str) -> Image:")
     img = PILImage.open(image_path)
-    img.thumbnail((100, 100))
-    return Image(data=img.tobytes(), format="png")
+    # Bilinear is the cheapest filter that still looks clean at thumbnail size
+    img.thumbnail((100, 100), PILImage.Resampling.BILINEAR)
+    # PNG has no CMYK or YCbCr modes, so e.g. CMYK JPEGs need converting first
+    if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        img = img.convert("RGB")
+    # Encode as an actual PNG; tobytes() is the raw pixel buffer. The lowest
+    # compression level keeps encoding cheap for a 100x100 image
+    buf = BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return Image(data=buf.getvalue(), format="png")
 
 @mcp.tool()
 def get_ascii_values(string: str) -> list[int]:
@@ -370,7 +437,16 @@ def get_ascii_values(string: str) -> list[int]:
         ascii_value("ABC")  # ❌ Wrong: wrong function name
     """
     print("CALLED: get_ascii_values(string: str) -> list[int]:")
-    return [int(ord(char)) for char in string]
+    return list(_ascii_values(string))
+
+# The cached helpers below return tuples so a caller can never mutate a cached
+# result; the tools hand out fresh lists
+@lru_cache(maxsize=256)
+def _ascii_values(string: str) -> tuple:
+    # Encoding pure ASCII yields the code points directly, all in C
+    if string.isascii():
+        return tuple(string.encode('ascii'))
+    return tuple(map(ord, string))
 
 class JsonValidator:
     """JSON validation helper for tool responses"""
@@ -465,6 +541,9 @@ async def send_email(to_email: str, subject: str, body: str, image_path: str = N
             f"Error sending email: {str(e)}"
         )
 
+# Compiled once at import instead of on every verify_email_format call
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 @mcp.tool()
 def verify_email_format(email: str) -> dict:
     """Verify if an email address is properly formatted.
@@ -475,9 +554,7 @@ def verify_email_format(email: str) -> dict:
     Returns:
         dict: Verification result with status and details
     """
-    import re
-    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    is_valid = bool(re.match(email_regex, email))
+    is_valid = bool(EMAIL_RE.match(email))
     
     return {
         "content": [
@@ -528,8 +605,9 @@ def verify_ascii_values(values: list) -> dict:
     Returns:
         dict: Verification result with status and details
     """
-    is_valid = all(isinstance(x, int) and 0 <= x <= 127 for x in values)
+    # One pass; the list stays empty in the common all-valid case
     invalid_values = [x for x in values if not (isinstance(x, int) and 0 <= x <= 127)]
+    is_valid = not invalid_values
     
     return {
         "content": [
@@ -601,7 +679,7 @@ def calculate_exponential_sum(numbers: list) -> dict:
             return JsonValidator.create_response(False, msg)
         
         # Calculate result
-        result = sum(math.exp(i) for i in numbers)
+        result = _exponential_sum(tuple(numbers))
         
         return JsonValidator.create_response(
             True,
@@ -615,6 +693,20 @@ def calculate_exponential_sum(numbers: list) -> dict:
             f"Calculation error: {str(e)}"
         )
 
+# Below this length NumPy's array setup costs more than the exp calls it saves
+EXP_SUM_VECTOR_MIN_LEN = 32
+
+@lru_cache(maxsize=256)
+def _exponential_sum(numbers: tuple) -> float:
+    if len(numbers) < EXP_SUM_VECTOR_MIN_LEN:
+        return sum(math.exp(i) for i in numbers)
+    with np.errstate(over='ignore'):
+        result = float(np.exp(np.asarray(numbers, dtype=np.float64)).sum())
+    # math.exp raises instead of returning inf; keep the error the same for both paths
+    if math.isinf(result):
+        raise OverflowError("math range error")
+    return result
+
 @mcp.tool()
 def generate_fibonacci_sequence(n: int) -> list:
     """Generate the first n numbers in the Fibonacci sequence.
@@ -629,12 +721,85 @@ def generate_fibonacci_sequence(n: int) -> list:
         generate_fibonacci_sequence(5) -> [0, 1, 1, 2, 3]
     """
     print("CALLED: generate_fibonacci_sequence(n: int) -> list:")
+    return list(_fibonacci_sequence(n))
+
+# Only sequences up to this length are memoized; longer ones would pin their
+# bigints in the cache for the life of the process
+FIB_CACHE_MAX_N = 1000
+
+def _fibonacci_sequence(n: int) -> tuple:
+    if n > FIB_CACHE_MAX_N:
+        return _build_fibonacci(n)
+    return _cached_fibonacci(n)
+
+def _build_fibonacci(n: int) -> tuple:
     if n <= 0:
-        return []
-    fib_sequence = [0, 1]
-    for _ in range(2, n):
-        fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
-    return fib_sequence[:n]
+        return ()
+    # Preallocate and carry the last two terms in locals instead of appending
+    fib_sequence = [0] * n
+    a, b = 0, 1
+    for i in range(n):
+        fib_sequence[i] = a
+        a, b = b, a + b
+    return tuple(fib_sequence)
+
+_cached_fibonacci = lru_cache(maxsize=64)(_build_fibonacci)
+
+@lru_cache(maxsize=1)
+def get_font():
+    """Load the canvas font once; parsing the TTC file on every call is slow."""
+    try:
+        # Try to use a common system font
+        font_path = '/System/Library/Fonts/Helvetica.ttc'
+        if os.path.exists(font_path):
+            return ImageFont.truetype(font_path, 36)
+        # Use default PIL font if Helvetica not available
+        return ImageFont.load_default()
+    except Exception:
+        # Fall back to default if any issues loading font
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=None)
+def compiled_applescript(source: str):
+    """Compile an AppleScript once; every later run reuses the compiled script."""
+    from Foundation import NSAppleScript
+    script = NSAppleScript.alloc().initWithSource_(source)
+    script.compileAndReturnError_(None)
+    return script
+
+def run_applescript(source: str) -> None:
+    """Run AppleScript in-process instead of spawning osascript/open per command.
+
+    NSAppleScript is only safe on the main thread, which is where the stdio
+    event loop runs, so this is deliberately not pushed to a worker thread.
+    """
+    _, error = compiled_applescript(source).executeAndReturnError_(None)
+    if error is not None:
+        print(f"AppleScript error: {error}", file=sys.stderr)
+
+def preview_script(image_path: str) -> str:
+    """AppleScript that swaps whatever Preview shows for image_path in one go."""
+    escaped = image_path.replace('\\', '\\\\').replace('"', '\\"')
+    return (
+        'tell application "Preview"\n'
+        '    close every window\n'
+        f'    open POSIX file "{escaped}"\n'
+        '    activate\n'
+        'end tell'
+    )
+
+async def show_in_preview(image_path):
+    """Show image_path in Preview without restarting the app.
+
+    Closing the windows and reopening the file is one compiled AppleScript run
+    in-process, so a redraw spawns no osascript or open subprocess. The file is
+    re-read from disk on open; the app itself never has to relaunch.
+    """
+    global preview_is_running
+    run_applescript(preview_script(image_path))
+    # A cold launch needs time to bring up the window, a running app barely any
+    await asyncio.sleep(0.2 if preview_is_running else 2)
+    preview_is_running = True
 
 @mcp.tool()
 async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
@@ -673,7 +838,6 @@ async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
         img = PILImage.new('RGB', (800, 600), color='white')
         
         # Draw the rectangle directly on the image
-        from PIL import ImageDraw
         draw = ImageDraw.Draw(img)
         
         # Use the coordinates provided by the client but ensure they're within bounds
@@ -694,6 +858,10 @@ async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
         final_image_path = os.path.join(temp_dir, "final_result.png")
         img.save(final_image_path)
         
+        # Keep the decoded image so add_text_in_paint can draw on it directly
+        global canvas_image
+        canvas_image = img
+        
         # Store the rectangle coordinates for text placement
         global rect_center_x, rect_center_y
         rect_center_x = (rect_left + rect_right) // 2
@@ -705,16 +873,8 @@ async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
         global rectangle_drawn
         rectangle_drawn = True
         
-        # If Preview is already running, replace the current image
-        if preview_is_running:
-            # Close any existing Preview first
-            subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-            await asyncio.sleep(1)
-        
-        # Open the image with Preview
-        subprocess.run(['open', '-a', 'Preview', final_image_path])
-        await asyncio.sleep(2)
-        preview_is_running = True
+        # Show the new image, reusing Preview if it is already running
+        await show_in_preview(final_image_path)
         
         return {
             "content": [
@@ -740,6 +900,8 @@ rect_center_x = None
 rect_center_y = None
 final_image_path = None
 rectangle_drawn = False
+# In-memory copy of whatever was last saved to final_image_path
+canvas_image = None
 
 @mcp.tool()
 async def add_text_in_paint(text: str) -> dict:
@@ -751,7 +913,7 @@ async def add_text_in_paint(text: str) -> dict:
     Returns:
         dict: Status message about the text addition
     """
-    global rectangle_drawn, rect_center_x, rect_center_y, final_image_path, preview_is_running
+    global rectangle_drawn, rect_center_x, rect_center_y, final_image_path, preview_is_running, canvas_image
     
     try:
         # Print the text visualization to the console
@@ -762,25 +924,13 @@ async def add_text_in_paint(text: str) -> dict:
         print("=================================\n")
         
         if rectangle_drawn and final_image_path:
-            # Open the previously created image with rectangle
-            img = PILImage.open(final_image_path)
+            # Draw on the image with the rectangle, only decoding the file if it is not in memory
+            img = canvas_image if canvas_image is not None else PILImage.open(final_image_path)
             
             # Add text to the image
-            from PIL import ImageDraw, ImageFont
             draw = ImageDraw.Draw(img)
             
-            # Try to load a default system font, or fall back to default
-            try:
-                # Try to use a common system font
-                font_path = '/System/Library/Fonts/Helvetica.ttc'
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, 36)
-                else:
-                    # Use default PIL font if Helvetica not available
-                    font = ImageFont.load_default()
-            except Exception:
-                # Fall back to default if any issues loading font
-                font = ImageFont.load_default()
+            font = get_font()
             
             # Center the text in the rectangle
             text_width = draw.textlength(text, font=font)
@@ -792,24 +942,12 @@ async def add_text_in_paint(text: str) -> dict:
             
             # Overwrite the same image file
             img.save(final_image_path)
+            canvas_image = img
             
             print(f"Text '{text}' added to image at: {final_image_path}")
             
-            # Close Preview and reopen with the updated image
-            if preview_is_running:
-                # Close any existing Preview first
-                subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-                await asyncio.sleep(1)
-                
-                # Reopen Preview with the updated image
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
-            else:
-                # If Preview wasn't running, just open it
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
+            # Show the updated image
+            await show_in_preview(final_image_path)
             
             return {
                 "content": [
@@ -824,18 +962,7 @@ async def add_text_in_paint(text: str) -> dict:
             img = PILImage.new('RGB', (800, 600), color='white')
             draw = ImageDraw.Draw(img)
             
-            # Try to load a default system font, or fall back to default
-            try:
-                # Try to use a common system font
-                font_path = '/System/Library/Fonts/Helvetica.ttc'
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, 36)
-                else:
-                    # Use default PIL font if Helvetica not available
-                    font = ImageFont.load_default()
-            except Exception:
-                # Fall back to default if any issues loading font
-                font = ImageFont.load_default()
+            font = get_font()
             
             # Center the text in the image
             text_width = draw.textlength(text, font=font)
@@ -849,22 +976,10 @@ async def add_text_in_paint(text: str) -> dict:
             temp_dir = tempfile.gettempdir()
             final_image_path = os.path.join(temp_dir, "final_result.png")
             img.save(final_image_path)
+            canvas_image = img
             
-            # Close and reopen Preview with the new image
-            if preview_is_running:
-                # Close any existing Preview first
-                subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-                await asyncio.sleep(1)
-                
-                # Reopen Preview with the updated image
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
-            else:
-                # If Preview wasn't running, just open it
-                subprocess.run(['open', '-a', 'Preview', final_image_path])
-                await asyncio.sleep(2)
-                preview_is_running = True
+            # Show the new image
+            await show_in_preview(final_image_path)
             
             print(f"Text '{text}' added to a new image at: {final_image_path}")
             
@@ -894,7 +1009,7 @@ async def open_paint() -> dict:
     Returns:
         dict: Status message about the Preview opening operation
     """
-    global preview_is_running, final_image_path
+    global preview_is_running, final_image_path, canvas_image
     
     try:
         print("Starting open_paint function...")
@@ -906,19 +1021,12 @@ async def open_paint() -> dict:
         temp_dir = tempfile.gettempdir()
         final_image_path = os.path.join(temp_dir, "final_result.png")
         img.save(final_image_path)
+        canvas_image = img
         
         print(f"Blank canvas created at: {final_image_path}")
         
-        # Force close any existing Preview to start fresh
-        subprocess.run(['osascript', '-e', 'tell application "Preview" to quit'], capture_output=True)
-        await asyncio.sleep(1)
-        
-        # Open the blank image with Preview
-        subprocess.run(['open', '-a', 'Preview', final_image_path])
-        await asyncio.sleep(2)
-        
-        # Set flag indicating Preview is running
-        preview_is_running = True
+        # Open the blank image with Preview, dropping any stale window
+        await show_in_preview(final_image_path)
         
         return {
             "content": [
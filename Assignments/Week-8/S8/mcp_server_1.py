@@ -20,6 +20,9 @@ import hashlib
 from pydantic import BaseModel
 import subprocess
 import sqlite3
+import threading
+from functools import lru_cache
+from io import BytesIO
 
 
 class PythonCodeInput(BaseModel):
@@ -32,61 +35,93 @@ class PythonCodeOutput(BaseModel):
 
 mcp = FastMCP("Calculator")
 
+# stdout carries the stdio JSON-RPC stream, so diagnostics go to stderr.
+# Set MCP_LOG_CALLS=1 to trace every tool invocation.
+LOG_CALLS = os.getenv("MCP_LOG_CALLS") == "1"
+
+def mcp_log(level: str, message: str) -> None:
+    sys.stderr.write(f"{level}: {message}\n")
+    sys.stderr.flush()
+
+def log_call(signature: str) -> None:
+    if LOG_CALLS:
+        mcp_log("CALLED", signature)
+
+# Fibonacci prefix shared across calls; only ever extended, never rewritten.
+# It is capped so a single huge n cannot pin its bigints for the process lifetime
+_fib_cache = [0, 1]
+_fib_lock = threading.Lock()
+FIB_CACHE_MAX_N = 1000
+
+# 0! .. 20!, every factorial that fits in a signed 64-bit integer
+_FACT_LUT = tuple(math.factorial(i) for i in range(21))
+# 500! is about 3700 bits; larger factorials are recomputed instead of memoized
+FACTORIAL_CACHE_MAX_N = 500
+# Longer strings and lists are converted per call so the caches stay small
+SEQ_CACHE_MAX_LEN = 1000
+
 
 @mcp.tool()
 def add(input: AddInput) -> AddOutput:
     """Add two numbers. Usage: add|input={"a": 10, "b": 5}"""
-    print("CALLED: add(AddInput) -> AddOutput")
+    log_call("add(AddInput) -> AddOutput")
     return AddOutput(result=input.a + input.b)
 
 @mcp.tool()
 def sqrt(input: SqrtInput) -> SqrtOutput:
     """Compute the square root of a number. Usage: sqrt|input={"a": 49}"""
-    print("CALLED: sqrt(SqrtInput) -> SqrtOutput")
-    return SqrtOutput(result=input.a ** 0.5)
+    log_call("sqrt(SqrtInput) -> SqrtOutput")
+    return SqrtOutput(result=math.sqrt(input.a))
 
 # subtraction tool
 @mcp.tool()
 def subtract(a: int, b: int) -> int:
     """Subtract one number from another. Usage: subtract|a=10|b=3"""
-    print("CALLED: subtract(a: int, b: int) -> int:")
-    return int(a - b)
+    log_call("subtract(a: int, b: int) -> int:")
+    return a - b
 
 # multiplication tool
 @mcp.tool()
 def multiply(a: int, b: int) -> int:
     """Multiply two integers. Usage: multiply|a=6|b=7"""
-    print("CALLED: multiply(a: int, b: int) -> int:")
-    return int(a * b)
+    log_call("multiply(a: int, b: int) -> int:")
+    return a * b
 
 #  division tool
 @mcp.tool() 
 def divide(a: int, b: int) -> float:
     """Divide one number by another. Usage: divide|a=20|b=4"""
-    print("CALLED: divide(a: int, b: int) -> float:")
-    return float(a / b)
+    log_call("divide(a: int, b: int) -> float:")
+    return a / b
 
 # power tool
 @mcp.tool()
-def power(a: int, b: int) -> int:
-    """Compute a raised to the power of b. Usage: power|a=2|b=10"""
-    print("CALLED: power(a: int, b: int) -> int:")
-    return int(a ** b)
+def power(a: int, b: int) -> int | float:
+    """Compute a raised to the power of b (a float when b is negative). Usage: power|a=2|b=10"""
+    log_call("power(a: int, b: int) -> int | float:")
+    return a ** b
 
 
 # cube root tool
 @mcp.tool()
 def cbrt(a: int) -> float:
     """Compute the cube root of a number. Usage: cbrt|a=27"""
-    print("CALLED: cbrt(a: int) -> float:")
-    return float(a ** (1/3))
+    log_call("cbrt(a: int) -> float:")
+    return math.cbrt(a)
 
 # factorial tool
+def _factorial_impl(a: int) -> int:
+    if a > FACTORIAL_CACHE_MAX_N:
+        return math.factorial(a)
+    return _cached_factorial(a)
+
+_cached_factorial = lru_cache(maxsize=128)(math.factorial)
+
 @mcp.tool()
 def factorial(a: int) -> int:
     """Compute the factorial of a number. Usage: factorial|a=5"""
-    print("CALLED: factorial(a: int) -> int:")
-    return int(math.factorial(a))
+    log_call("factorial(a: int) -> int:")
+    return _FACT_LUT[a] if 0 <= a < len(_FACT_LUT) else _factorial_impl(a)
 
 # log tool
 # @mcp.tool()
@@ -99,69 +134,115 @@ def factorial(a: int) -> int:
 @mcp.tool()
 def remainder(a: int, b: int) -> int:
     """Compute the remainder of a divided by b. Usage: remainder|a=17|b=4"""
-    print("CALLED: remainder(a: int, b: int) -> int:")
-    return int(a % b)
+    log_call("remainder(a: int, b: int) -> int:")
+    return a % b
 
 # sin tool
 @mcp.tool()
 def sin(a: int) -> float:
     """Compute sine of an angle in radians. Usage: sin|a=1"""
-    print("CALLED: sin(a: int) -> float:")
-    return float(math.sin(a))
+    log_call("sin(a: int) -> float:")
+    return math.sin(a)
 
 # cos tool
 @mcp.tool()
 def cos(a: int) -> float:
     """Compute cosine of an angle in radians. Usage: cos|a=1"""
-    print("CALLED: cos(a: int) -> float:")
-    return float(math.cos(a))
+    log_call("cos(a: int) -> float:")
+    return math.cos(a)
 
 # tan tool
 @mcp.tool()
 def tan(a: int) -> float:
     """Compute tangent of an angle in radians. Usage: tan|a=1"""
-    print("CALLED: tan(a: int) -> float:")
-    return float(math.tan(a))
+    log_call("tan(a: int) -> float:")
+    return math.tan(a)
 
 # mine tool
 @mcp.tool()
 def mine(a: int, b: int) -> int:
     """special mining tool"""
-    print("CALLED: mine(a: int, b: int) -> int:")
-    return int(a - b - b)
+    log_call("mine(a: int, b: int) -> int:")
+    return a - b - b
+
+@lru_cache(maxsize=64)
+def _thumbnail_png(image_path: str, mtime: float) -> bytes:
+    """Encode a 100x100 PNG thumbnail; mtime is part of the key so edited files are re-read."""
+    img = PILImage.open(image_path)
+    img.thumbnail((100, 100))
+    if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+    buf = BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
 
 @mcp.tool()
 def create_thumbnail(image_path: str) -> Image:
     """Create a 100x100 thumbnail from image. Usage: create_thumbnail|image_path="example.jpg\""""
-    print("CALLED: create_thumbnail(image_path: str) -> Image:")
-    img = PILImage.open(image_path)
-    img.thumbnail((100, 100))
-    return Image(data=img.tobytes(), format="png")
+    log_call("create_thumbnail(image_path: str) -> Image:")
+    png_bytes = _thumbnail_png(image_path, os.path.getmtime(image_path))
+    return Image(data=png_bytes, format="png")
+
+# Cached kernels return immutable values; the tools copy them into fresh lists
+def _code_points(string: str) -> tuple:
+    if len(string) > SEQ_CACHE_MAX_LEN:
+        return _compute_code_points(string)
+    return _cached_code_points(string)
+
+def _compute_code_points(string: str) -> tuple:
+    if string.isascii():
+        return tuple(string.encode('ascii'))
+    encoded = string.encode('utf-32-le', errors='surrogatepass')
+    return tuple(np.frombuffer(encoded, dtype='<u4').tolist())
+
+_cached_code_points = lru_cache(maxsize=256)(_compute_code_points)
+
+def _exp_sum(int_list: tuple) -> float:
+    if len(int_list) > SEQ_CACHE_MAX_LEN:
+        return _compute_exp_sum(int_list)
+    return _cached_exp_sum(int_list)
+
+def _compute_exp_sum(int_list: tuple) -> float:
+    values = np.fromiter(int_list, dtype=np.float64, count=len(int_list))
+    with np.errstate(over='ignore'):
+        result = float(np.exp(values).sum())
+    # math.exp raises instead of returning inf; keep that error for large inputs
+    if not math.isfinite(result):
+        raise OverflowError("math range error")
+    return result
+
+_cached_exp_sum = lru_cache(maxsize=1024)(_compute_exp_sum)
 
 @mcp.tool()
 def strings_to_chars_to_int(input: StringsToIntsInput) -> StringsToIntsOutput:
     """Convert characters to ASCII values. Usage: strings_to_chars_to_int|input={"string": "INDIA"}"""
-    print("CALLED: strings_to_chars_to_int(StringsToIntsInput) -> StringsToIntsOutput")
-    ascii_values = [ord(char) for char in input.string]
-    return StringsToIntsOutput(ascii_values=ascii_values)
+    log_call("strings_to_chars_to_int(StringsToIntsInput) -> StringsToIntsOutput")
+    return StringsToIntsOutput(ascii_values=list(_code_points(input.string)))
 
 @mcp.tool()
 def int_list_to_exponential_sum(input: ExpSumInput) -> ExpSumOutput:
     """Sum exponentials of int list. Usage: int_list_to_exponential_sum|input={"numbers": [65, 66, 67]}"""
-    print("CALLED: int_list_to_exponential_sum(ExpSumInput) -> ExpSumOutput")
-    result = sum(math.exp(i) for i in input.int_list)
-    return ExpSumOutput(result=result)
+    log_call("int_list_to_exponential_sum(ExpSumInput) -> ExpSumOutput")
+    return ExpSumOutput(result=_exp_sum(tuple(input.int_list)))
 
 @mcp.tool()
 def fibonacci_numbers(n: int) -> list:
     """Generate first n Fibonacci numbers. Usage: fibonacci_numbers|n=10"""
-    print("CALLED: fibonacci_numbers(n: int) -> list:")
+    log_call("fibonacci_numbers(n: int) -> list:")
     if n <= 0:
         return []
-    fib_sequence = [0, 1]
-    for _ in range(2, n):
-        fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
-    return fib_sequence[:n]
+    if n > FIB_CACHE_MAX_N:
+        # Too long to keep around; build it for this call only
+        out = [0] * n
+        a, b = 0, 1
+        for i in range(n):
+            out[i] = a
+            a, b = b, a + b
+        return out
+    with _fib_lock:
+        while len(_fib_cache) < n:
+            _fib_cache.append(_fib_cache[-1] + _fib_cache[-2])
+        return _fib_cache[:n]
 
 # New Tools
 from io import StringIO
@@ -245,15 +326,15 @@ def run_sql_query(input: PythonCodeInput) -> PythonCodeOutput:
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
     """Get a personalized greeting"""
-    print("CALLED: get_greeting(name: str) -> str:")
+    log_call("get_greeting(name: str) -> str:")
     return f"Hello, {name}!"
 
 
 # DEFINE AVAILABLE PROMPTS
 @mcp.prompt()
 def review_code(code: str) -> str:
+    log_call("review_code(code: str) -> str:")
     return f"Please review this code:\n\n{code}"
-    print("CALLED: review_code(code: str) -> str:")
 
 
 @mcp.prompt()
@@ -266,9 +347,9 @@ def debug_error(error: str) -> list[base.Message]:
 
 
 if __name__ == "__main__":
-    print("mcp_server_1.py starting")
+    mcp_log("INFO", "mcp_server_1.py starting")
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
             mcp.run()  # Run without transport for dev server
     else:
         mcp.run(transport="stdio")  # Run with stdio for direct execution
-        print("\nShutting down...")
+        mcp_log("INFO", "Shutting down...")